@@ -1,34 +1,43 @@
 import os
+import sys
 from collections import Counter
 from src.models.config import Config
 from src.json_generator import generate_json
 from src.html_generator import generate_html, load_texts
+from src.tools import ensure_dir, process_tracks
+from src.cards_generator import build_tables, generate_cards
+
+# Histogram bars are slices of this string, so they are capped at its length.
+BAR = "#" * 60
+
+
+def print_statistics(tracks):
+    """Print how the tracks are spread over years and decades."""
+    year_counts = Counter(track.year for track in tracks)
+    decade_counts = Counter()
+    for year, count in year_counts.items():
+        decade_counts[year - year % 10] += count
+    # Build the whole report first and write it out in one go.
+    lines = ["", "YEAR STATISTICS"]
+    for year, count in sorted(year_counts.items()):
+        lines.append(f"{year}: {count:2} {BAR[:count]}")
+    lines += ["", "DECADE STATISTICS"]
+    for decade, count in sorted(decade_counts.items()):
+        lines.append(f"{decade}s: {count:2} {BAR[:count]}")
+    lines += ["", f"TOTAL: {sum(year_counts.values())} tracks"]
+    sys.stdout.write("\n".join(lines) + "\n")
+
 
 # Main orchestration
 
 def main():
     config = Config.load("config.toml")
-    os.makedirs(config.out_dir, exist_ok=True)
-    os.makedirs("build", exist_ok=True)
+    ensure_dir(config.out_dir)
+    ensure_dir("build")
     track_dir = "tracks"
 
-    from src.tools import process_tracks
-    tracks = process_tracks(track_dir, config)
-    # Build tables from tracks
-    from src.cards_generator import Table
-    table = Table.new()
-    tables = []
-    year_counts = Counter()
-    decade_counts = Counter()
-    for track in tracks:
-        table.append(track)
-        year_counts[track.year] += 1
-        decade_counts[10 * (track.year // 10)] += 1
-        if table.is_full():
-            tables.append(table)
-            table = Table.new()
-    if not table.is_empty():
-        tables.append(table)
+    tracks = process_tracks(track_dir, config, os.path.join("build", "tags.json"))
+    tables = build_tables(tracks)
 
     # Generate JSON file
     json_output_path = os.path.join(config.out_dir, "index.json")
@@ -40,18 +49,11 @@ def main():
     generate_html(config.out_dir, config, texts)
     print(f"Website generated in {config.out_dir}")
 
-    from src.cards_generator import generate_cards
     try:
         generate_cards(tables, config)
     except Exception as e:
         print(f"Warning: Cards generation failed: {e}")
-    print(f"\nYEAR STATISTICS")
-    for year, count in sorted(year_counts.items()):
-        print(f"{year}: {count:2} {'#' * count}")
-    print(f"\nDECADE STATISTICS")
-    for decade, count in sorted(decade_counts.items()):
-        print(f"{decade}s: {count:2} {'#' * count}")
-    print(f"\nTOTAL: {sum(decade_counts.values())} tracks")
+    print_statistics(tracks)
 
 
 if __name__ == "__main__":
@@ -1,77 +1,114 @@
 import os
-import time
 import html
+import io
+import math
 import subprocess
 import shutil
-from typing import List, Iterable, Literal, NamedTuple
-from PyPDF2 import PdfMerger
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache
+from itertools import accumulate
+from typing import BinaryIO, List, Iterable, NamedTuple, Tuple
+import pikepdf
 from src.models.track import Track
 from src.models.config import Config
+from src.tools import ensure_dir
 
 def generate_cards(tables, config):
 	temp_dir = "temp"
 	out_dir = config.out_dir if hasattr(config, 'out_dir') else "out"
 	os.makedirs(temp_dir, exist_ok=True)
-	os.makedirs(out_dir, exist_ok=True)
-	pdf_inputs = []
-	pdf_outputs = []
-	# Generate SVG and PDF for each page side
-	for i, table in enumerate(tables):
-		p = i + 1
-		title_svg = os.path.join(temp_dir, f"{p}a.svg")
-		qr_svg = os.path.join(temp_dir, f"{p}b.svg")
-		title_pdf = os.path.join(temp_dir, f"{p}a.pdf")
-		qr_pdf = os.path.join(temp_dir, f"{p}b.pdf")
-		pdf_inputs.extend([title_svg, qr_svg])
-		pdf_outputs.extend([title_pdf, qr_pdf])
-		with open(title_svg, "w", encoding="utf-8") as f:
-			f.write(table.render_svg(config, "title", f"{p}a"))
-		with open(qr_svg, "w", encoding="utf-8") as f:
-			f.write(table.render_svg(config, "qr", f"{p}b"))
-	# Convert SVGs to PDFs using Inkscape
-	print(f"Converting svgs to pdf using Inkscape...")
-	for svg_file, pdf_file in zip(pdf_inputs, pdf_outputs):
-		subprocess.check_call([
-			"inkscape", svg_file, "--export-type=pdf",
-			f"--export-filename={pdf_file}", "--export-background=white"
-		])
-		for _ in range(20):
-			if os.path.isfile(pdf_file):
-				break
-			time.sleep(0.1)
-		if not os.path.isfile(pdf_file):
-			print(f"ERROR: PDF was not generated: {pdf_file}")
-			exit(1)
-	print("Waiting 15 seconds to ensure all PDFs are ready before merging...")
-	time.sleep(15)
+	ensure_dir(out_dir)
 	final_pdf = os.path.join(out_dir, "cards.pdf")
-	print(f"Merging PDFs into {final_pdf}...")
-	merger = PdfMerger()
-	for pdf_file in pdf_outputs:
-		merger.append(pdf_file)
-	merger.write(final_pdf)
-	merger.close()
+	# Pages are converted while later ones are still being rendered, and the
+	# merge consumes the conversions in page order as they finish.
+	print(f"Rendering svgs and converting them to pdf using Inkscape...")
+	# Starting Inkscape costs far more than converting one page, so every
+	# process converts a batch of files, sized to keep all workers busy.
+	workers = os.cpu_count() or 1
+	batch_size = max(1, math.ceil(2 * len(tables) / workers))
+	with ThreadPoolExecutor(max_workers=workers) as executor:
+		conversions = []
+		batch = []
+		for i, table in enumerate(tables):
+			p = i + 1
+			title_svg = os.path.join(temp_dir, f"{p}a.svg")
+			qr_svg = os.path.join(temp_dir, f"{p}b.svg")
+			with open(title_svg, "wb") as title_f, open(qr_svg, "wb") as qr_f:
+				table.render_svgs_to(title_f, qr_f, config, f"{p}a", f"{p}b")
+			for svg_file in (title_svg, qr_svg):
+				batch.append(svg_file)
+				if len(batch) == batch_size or (p == len(tables) and svg_file == qr_svg):
+					conversion = executor.submit(inkscape_svgs_to_pdfs, batch)
+					for svg in batch:
+						conversions.append((os.path.splitext(svg)[0] + ".pdf", conversion))
+					batch = []
+		print(f"Merging PDFs into {final_pdf}...")
+		# Copied pages keep referring to their source file until the merged
+		# document is saved, so every input stays open until then.
+		with ExitStack() as stack:
+			merged = stack.enter_context(pikepdf.Pdf.new())
+			for pdf_file, conversion in conversions:
+				conversion.result()
+				# Inkscape has exited by the time subprocess.run returns, so its
+				# output is complete; a missing file means the export failed.
+				if not os.path.isfile(pdf_file):
+					print(f"ERROR: PDF was not generated: {pdf_file}")
+					exit(1)
+				merged.pages.extend(stack.enter_context(pikepdf.open(pdf_file)).pages)
+			merged.save(final_pdf)
 	print(f"Done! Output is {final_pdf}.")
-	# Remove temporary SVG and PDF files and temp dir
+	# Remove temporary SVG and PDF files and temp dir. Renaming is instant, the
+	# actual deletion runs in a background thread while the build carries on.
+	# The trash dir gets a fresh name, so it cannot clash with one that an
+	# earlier call is still deleting. It lives in the build scratch dir, so a
+	# run killed mid-delete leaves nothing behind in the working directory.
+	ensure_dir("build")
+	trash_dir = tempfile.mkdtemp(prefix=f"{temp_dir}.trash.", dir="build")
 	try:
-		shutil.rmtree(temp_dir)
+		os.rename(temp_dir, os.path.join(trash_dir, temp_dir))
 	except Exception as e:
 		print(f"Warning: could not remove temp dir {temp_dir}: {e}")
+	threading.Thread(target=remove_temp_dir, args=(trash_dir,)).start()
 
-def line_break_text(s: str) -> List[str]:
+def remove_temp_dir(path: str) -> None:
+	try:
+		shutil.rmtree(path)
+	except Exception as e:
+		print(f"Warning: could not remove temp dir {path}: {e}")
+
+def inkscape_svgs_to_pdfs(svg_files: List[str]) -> None:
+	"""
+	Convert all svg_files with a single Inkscape process. Each pdf is written
+	next to its svg, with the extension replaced.
+	"""
+	subprocess.run([
+		"inkscape", "--export-type=pdf", "--export-background=white", *svg_files
+	], check=True)
+
+@lru_cache(maxsize=4096)
+def line_break_text(s: str) -> Tuple[str, ...]:
+	# Cached, so a tuple rather than a list: callers must not mutate it.
 	if len(s) < 24:
-		return [s]
+		return (s,)
 	words = s.split(" ")
-	char_count = sum(len(word) for word in words)
-	top, bot = " ".join(words), ""
-	diff = char_count
-	for i in range(1, len(words) - 1):
-		w1, w2 = words[:i], words[i:]
-		t, b = " ".join(w1), " ".join(w2)
-		d = abs(len(t) - len(b))
+	# Only the line lengths matter, and those follow from the running word
+	# lengths, so no candidate line has to be built to be measured.
+	prefix_lens = list(accumulate(len(word) for word in words))
+	char_count = prefix_lens[-1]
+	n = len(words)
+	best, diff = 0, char_count
+	for i in range(1, n - 1):
+		top_len = prefix_lens[i - 1] + i - 1
+		bot_len = char_count - prefix_lens[i - 1] + n - i - 1
+		d = abs(top_len - bot_len)
 		if d < diff:
-			top, bot, diff = t, b, d
-	return [top, bot]
+			best, diff = i, d
+	if best == 0:
+		return (s, "")
+	return (" ".join(words[:best]), " ".join(words[best:]))
 
 def render_text_svg(x_mm: float, y_mm: float, s: str, class_: str) -> Iterable[str]:
 	lines = line_break_text(s)
@@ -83,6 +120,62 @@ def render_text_svg(x_mm: float, y_mm: float, s: str, class_: str) -> Iterable[s
 			f'<text x="{x_mm}" y="{y_mm + dy_mm}" text-anchor="middle" class="{class_}">{html.escape(line)}</text>'
 		)
 
+# Page and card sizes; the svg user unit is one mm.
+PAGE_W_MM = 210
+PAGE_H_MM = 297
+CELL_MM = 62
+
+@lru_cache(maxsize=None)
+def page_grid_mm(width: int, height: int) -> Tuple[Tuple[float, ...], Tuple[float, ...]]:
+	"""
+	Return the x positions of the vertical and the y positions of the
+	horizontal cell boundaries of a width x height table, centered on the
+	page with equal margins on all sides.
+	"""
+	margin_mm = (PAGE_W_MM - CELL_MM * width) / 2
+	xs_mm = tuple(margin_mm + ix * CELL_MM for ix in range(width + 1))
+	ys_mm = tuple(margin_mm + iy * CELL_MM for iy in range(height + 1))
+	return xs_mm, ys_mm
+
+@lru_cache(maxsize=None)
+def render_frame_svg(font: str, grid: bool, crop_marks: bool, width: int, height: int) -> str:
+	"""
+	Render the part of a page that does not depend on its cards: the svg
+	header, the style sheet, the grid and the crop marks.
+	"""
+	xs_mm, ys_mm = page_grid_mm(width, height)
+	hmargin_mm, vmargin_mm = xs_mm[0], ys_mm[0]
+	tw_mm = CELL_MM * width
+	th_mm = CELL_MM * height
+	out = io.StringIO()
+	write = out.write
+	write('<svg version="1.1" width="210mm" height="297mm" viewBox="0 0 210 297" xmlns="http://www.w3.org/2000/svg">\n')
+	write('<rect x="0" y="0" width="210" height="297" fill="white"/>\n')
+	write(f"""
+			<style>
+			text {{ font-family: {font!r}; }}
+			.year {{ font-size: 18px; font-weight: 900; }}
+			.title, .artist, .footer {{ font-size: 5.2px; font-weight: 400; }}
+			.title {{ font-style: italic; }}
+			rect, line {{ stroke: black; stroke-width: 0.2; }}
+			</style>
+			\n""")
+	if grid:
+		write(f'<rect x="{hmargin_mm}" y="{vmargin_mm}" width="{tw_mm}" height="{th_mm}" fill="none" stroke-linejoin="miter"/>\n')
+	for ix, x_mm in enumerate(xs_mm):
+		if grid and ix > 0:
+			write(f'<line x1="{x_mm}" y1="{vmargin_mm}" x2="{x_mm}" y2="{vmargin_mm + th_mm}" />\n')
+		if crop_marks:
+			write(f'<line x1="{x_mm}" y1="{vmargin_mm - 5}" x2="{x_mm}" y2="{vmargin_mm - 1}" />'
+				  f'<line x1="{x_mm}" y1="{vmargin_mm + th_mm + 1}" x2="{x_mm}" y2="{vmargin_mm + th_mm + 5}" />\n')
+	for iy, y_mm in enumerate(ys_mm):
+		if grid and iy > 0:
+			write(f'<line x1="{hmargin_mm}" y1="{y_mm}" x2="{hmargin_mm + tw_mm}" y2="{y_mm}" />\n')
+		if crop_marks:
+			write(f'<line x1="{hmargin_mm - 5}" y1="{y_mm}" x2="{hmargin_mm - 1}" y2="{y_mm}" />'
+				  f'<line x1="{hmargin_mm + tw_mm + 1}" y1="{y_mm}" x2="{hmargin_mm + tw_mm + 5}" y2="{y_mm}" />\n')
+	return out.getvalue()
+
 class Table(NamedTuple):
 	cells: List[Track]
 	width: int = 3
@@ -96,64 +189,47 @@ class Table(NamedTuple):
 		return len(self.cells) == 0
 	def is_full(self) -> bool:
 		return len(self.cells) >= self.width * self.height
-	def render_svg(self, config: Config, mode: Literal["qr"] | Literal["title"], page_footer: str) -> str:
-		# ...existing code for SVG rendering...
-		w_mm = 210
-		h_mm = 297
-		side_mm = 62
-		tw_mm = side_mm * self.width
-		th_mm = side_mm * self.height
-		hmargin_mm = (w_mm - tw_mm) / 2
-		vmargin_mm = (h_mm - th_mm) / 2
-		vmargin_mm = hmargin_mm
-		parts: List[str] = []
-		parts.append('<svg version="1.1" width="210mm" height="297mm" viewBox="0 0 210 297" xmlns="http://www.w3.org/2000/svg">')
-		parts.append('<rect x="0" y="0" width="210" height="297" fill="white"/>')
-		parts.append(f"""
-			<style>
-			text {{ font-family: {config.font!r}; }}
-			.year {{ font-size: 18px; font-weight: 900; }}
-			.title, .artist, .footer {{ font-size: 5.2px; font-weight: 400; }}
-			.title {{ font-style: italic; }}
-			rect, line {{ stroke: black; stroke-width: 0.2; }}
-			</style>
-			""")
-		if config.grid:
-			parts.append(f'<rect x="{hmargin_mm}" y="{vmargin_mm}" width="{tw_mm}" height="{th_mm}" fill="none" stroke-linejoin="miter"/>')
-		for ix in range(0, self.width + 1):
-			x_mm = hmargin_mm + ix * side_mm
-			if config.grid and ix > 0 and ix <= self.width:
-				parts.append(f'<line x1="{x_mm}" y1="{vmargin_mm}" x2="{x_mm}" y2="{vmargin_mm + th_mm}" />')
-			if config.crop_marks:
-				parts.append(f'<line x1="{x_mm}" y1="{vmargin_mm - 5}" x2="{x_mm}" y2="{vmargin_mm - 1}" />'
-							 f'<line x1="{x_mm}" y1="{vmargin_mm + th_mm + 1}" x2="{x_mm}" y2="{vmargin_mm + th_mm + 5}" />')
-		for iy in range(0, self.height + 1):
-			y_mm = vmargin_mm + iy * side_mm
-			if config.grid and iy > 0 and iy <= self.height:
-				parts.append(f'<line x1="{hmargin_mm}" y1="{y_mm}" x2="{hmargin_mm + tw_mm}" y2="{y_mm}" />')
-			if config.crop_marks:
-				parts.append(f'<line x1="{hmargin_mm - 5}" y1="{y_mm}" x2="{hmargin_mm - 1}" y2="{y_mm}" />'
-							 f'<line x1="{hmargin_mm + tw_mm + 1}" y1="{y_mm}" x2="{hmargin_mm + tw_mm + 5}" y2="{y_mm}" />')
+	def render_svgs_to(self, title_f: BinaryIO, qr_f: BinaryIO, config: Config, title_footer: str, qr_footer: str) -> None:
+		"""
+		Render both sides of the page in a single pass over the cells, writing
+		the title side to title_f and the qr side to qr_f as UTF-8, fragment by
+		fragment, without building either document in memory first.
+		"""
+		xs_mm, ys_mm = page_grid_mm(self.width, self.height)
+		frame = render_frame_svg(config.font, config.grid, config.crop_marks, self.width, self.height).encode("utf-8")
+		title_f.write(frame)
+		qr_f.write(frame)
 		for i, track in enumerate(self.cells):
-			if mode == "qr":
-				ix = self.width - 1 - (i % self.width)
-				iy = i // self.width
-				qr_path, qr_mm = track.qr_svg()
-				x_mm = hmargin_mm + ix * side_mm + (side_mm - qr_mm) / 2
-				y_mm = vmargin_mm + iy * side_mm + (side_mm - qr_mm) / 2
-				parts.append(f'<g transform="translate({x_mm}, {y_mm})">')
-				parts.append(qr_path)
-				parts.append(f"</g>")
-			if mode == "title":
-				ix = i % self.width
-				iy = i // self.width
-				x_mm = hmargin_mm + (ix + 0.5) * side_mm
-				y_mm = vmargin_mm + (iy + 0.5) * side_mm
-				parts.append(f'<text x="{x_mm}" y="{y_mm + 6.5}" text-anchor="middle" class="year">{track.year}</text>')
-				for part in render_text_svg(x_mm, y_mm - 19, track.artist, "artist"):
-					parts.append(part)
-				for part in render_text_svg(x_mm, y_mm + 18, track.title, "title"):
-					parts.append(part)
-		parts.append(f'<text x="{w_mm - hmargin_mm}" y="{h_mm - hmargin_mm}" text-anchor="end" class="footer">{html.escape(page_footer)}</text>')
-		parts.append("</svg>")
-		return "\n".join(parts)
+			title_f.write(self._render_title_cell(i, track, xs_mm, ys_mm).encode("utf-8"))
+			qr_f.write(self._render_qr_cell(i, track, xs_mm, ys_mm).encode("utf-8"))
+		title_f.write(render_footer_svg(xs_mm, title_footer).encode("utf-8"))
+		qr_f.write(render_footer_svg(xs_mm, qr_footer).encode("utf-8"))
+	def _render_title_cell(self, i: int, track: Track, xs_mm: Tuple[float, ...], ys_mm: Tuple[float, ...]) -> str:
+		x_mm = xs_mm[i % self.width] + CELL_MM / 2
+		y_mm = ys_mm[i // self.width] + CELL_MM / 2
+		parts = [f'<text x="{x_mm}" y="{y_mm + 6.5}" text-anchor="middle" class="year">{track.year}</text>\n']
+		for part in render_text_svg(x_mm, y_mm - 19, track.artist, "artist"):
+			parts.append(part + "\n")
+		for part in render_text_svg(x_mm, y_mm + 18, track.title, "title"):
+			parts.append(part + "\n")
+		return "".join(parts)
+	def _render_qr_cell(self, i: int, track: Track, xs_mm: Tuple[float, ...], ys_mm: Tuple[float, ...]) -> str:
+		# The qr side is mirrored horizontally so each code lands behind its title.
+		qr_path, qr_mm = track.qr_svg()
+		x_mm = xs_mm[self.width - 1 - (i % self.width)] + (CELL_MM - qr_mm) / 2
+		y_mm = ys_mm[i // self.width] + (CELL_MM - qr_mm) / 2
+		return f'<g transform="translate({x_mm}, {y_mm})">\n{qr_path}\n</g>\n'
+
+def render_footer_svg(xs_mm: Tuple[float, ...], page_footer: str) -> str:
+	return f'<text x="{PAGE_W_MM - xs_mm[0]}" y="{PAGE_H_MM - xs_mm[0]}" text-anchor="end" class="footer">{html.escape(page_footer)}</text>\n</svg>'
+
+def build_tables(tracks: List[Track]) -> List[Table]:
+	"""
+	Split the tracks, in order, over as many full tables (pages) as needed.
+	"""
+	page = Table.new()
+	per_page = page.width * page.height
+	return [
+		Table(cells=tracks[i:i + per_page])
+		for i in range(0, len(tracks), per_page)
+	]
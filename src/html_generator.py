@@ -1,58 +1,68 @@
 import os
-import json
+from functools import lru_cache
+import orjson
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 
+# Shared by all calls, so each template is only loaded and compiled once per
+# process. The templates ship with the code, so they are not checked for
+# changes on disk.
+_ENV = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), "templates")),
+    autoescape=select_autoescape(["html", "xml", "jinja"]),
+    auto_reload=False,
+)
+
 
 def generate_html(out_dir, config, texts):
     """Render the entire website in out_dir using Jinja2 templates."""
     title = getattr(config, "title", "Hits!")
     emoji = getattr(config, "emoji", "🎸")
-    templates_dir = os.path.join(os.path.dirname(__file__), "templates")
-    env = Environment(
-        loader=FileSystemLoader(templates_dir),
-        autoescape=select_autoescape(["html", "xml", "jinja"]),
-    )
-    template = env.get_template("index.html.jinja")
-    rendered = template.render(
-        config=config,
-        title=title,
-        emoji=emoji,
-        texts=texts,
-    )
+    # Templates are streamed into the files, so no page is ever held in
+    # memory as a whole.
+    template = _ENV.get_template("index.html.jinja")
     with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as f:
-        f.write(rendered)
+        template.stream(
+            config=config,
+            title=title,
+            emoji=emoji,
+            texts=texts,
+        ).dump(f)
     # Generate CSS
     try:
-        css_tmpl = env.get_template("main.css.jinja")
-        css_rendered = css_tmpl.render()
+        css_tmpl = _ENV.get_template("main.css.jinja")
         with open(os.path.join(out_dir, "main.css"), "w", encoding="utf-8") as f_css:
-            f_css.write(css_rendered)
+            css_tmpl.stream().dump(f_css)
     except Exception as e:
         print(f"Warning: could not render main.css: {e}")
     # Generate JS
     try:
-        js_tmpl = env.get_template("index.js.jinja")
-        js_rendered = js_tmpl.render(
-            config=config,
-            title=title,
-            emoji=emoji,
-            texts=texts,
-        )
+        js_tmpl = _ENV.get_template("index.js.jinja")
         with open(os.path.join(out_dir, "index.js"), "w", encoding="utf-8") as f_js:
-            f_js.write(js_rendered)
+            js_tmpl.stream(
+                config=config,
+                title=title,
+                emoji=emoji,
+                texts=texts,
+            ).dump(f_js)
     except Exception as e:
         print(f"Warning: could not render index.js: {e}")
 
 
 def load_texts(config):
-    lang_file = os.path.join("translations", f"{config.language}.json")
+    return _load_texts_by_lang(config.language)
+
+
+@lru_cache(maxsize=None)
+def _load_texts_by_lang(language):
+    # Cached, so every caller gets the same dict: it must not be mutated.
+    lang_file = os.path.join("translations", f"{language}.json")
     default_file = os.path.join("translations", "en.json")
     if os.path.isfile(lang_file):
-        with open(lang_file, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(lang_file, "rb") as f:
+            return orjson.loads(f.read())
     else:
         print(
-            f"Warning: Translation file for '{config.language}' not found. Falling back to English."
+            f"Warning: Translation file for '{language}' not found. Falling back to English."
         )
-        with open(default_file, "r", encoding="utf-8") as f:
-            return json.load(f)
\ No newline at end of file
+        with open(default_file, "rb") as f:
+            return orjson.loads(f.read())
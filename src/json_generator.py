@@ -1,17 +1,15 @@
-import json
+import orjson
+from operator import attrgetter
+from pathlib import Path
 from src.tools import output_mp4_name
 
+# Track fields copied into index.json as-is, in output order.
+_FIELDS = ("year", "title", "artist", "md5sum", "url")
+_get_fields = attrgetter(*_FIELDS)
+
 def generate_json(tracks, output_path):
 	data = [
-		{
-			"year": track.year,
-			"title": track.title,
-			"artist": track.artist,
-			"md5sum": track.md5sum,
-			"url": track.url,
-			"filename": output_mp4_name(track.md5sum)
-		}
+		dict(zip(_FIELDS, _get_fields(track)), filename=output_mp4_name(track.md5sum))
 		for track in tracks
 	]
-	with open(output_path, "w", encoding="utf-8") as f:
-		json.dump(data, f, indent=4, ensure_ascii=False)
+	Path(output_path).write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
@@ -1,4 +1,6 @@
+import os
 import tomllib
+from functools import lru_cache
 from typing import NamedTuple
 
 class Config(NamedTuple):
@@ -12,6 +14,12 @@ class Config(NamedTuple):
 
     @staticmethod
     def load(fname: str) -> "Config":
-        with open(fname, "rb") as f:
-            toml = tomllib.load(f)
-            return Config(**toml)
+        return _load_config(fname, os.stat(fname).st_mtime_ns)
+
+
+@lru_cache(maxsize=4)
+def _load_config(fname: str, mtime_ns: int) -> Config:
+    # Keyed on the modification time so an edited file is parsed again.
+    with open(fname, "rb") as f:
+        toml = tomllib.load(f)
+        return Config(**toml)
@@ -1,45 +1,135 @@
 import os
 import subprocess
-from typing import Dict, Tuple		
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Dict, Optional, Tuple
 import hashlib
+import orjson
 import soundfile as sf
+from mutagen.flac import FLAC
 
-def process_tracks(track_dir: str, config) -> list:
+# Directories already created by ensure_dir in this process.
+_created_dirs = set()
+
+
+def ensure_dir(path: str) -> None:
+	"""
+	Create `path` (and its parents) unless this process already did so.
+	"""
+	if path in _created_dirs:
+		return
+	if not os.path.isdir(path):
+		os.makedirs(path, exist_ok=True)
+	_created_dirs.add(path)
+
+
+def _load_track(config, tag_cache: dict, entry: os.DirEntry):
 	from src.models.track import Track
+	return Track.load(config, entry.path, tag_cache, entry.stat())
+
+
+def _encode_track(config, track) -> None:
+	ensure_encoded_audio(track.fname, track.md5sum, config.out_dir)
+
+
+def process_tracks(track_dir: str, config, tag_cache_path: Optional[str] = None) -> list:
 	"""
 	Process all FLAC files in track_dir, create Track objects, encode audio, sort and return the tracks list.
+	Files are loaded and then encoded in parallel, one worker thread per CPU.
+	If tag_cache_path is given, tags of unchanged files are reused from there.
 	"""
-	tracks = []
-	for fname in os.listdir(track_dir):
-		if not fname.endswith(".flac"):
-			continue
-		fname_full = os.path.join(track_dir, fname)
-		track = Track.load(config, fname_full)
-		ensure_encoded_audio(track.fname, track.md5sum, config.out_dir)
-		tracks.append(track)
+	with os.scandir(track_dir) as it:
+		entries = [
+			entry for entry in it
+			if entry.name.endswith(".flac") and entry.is_file()
+		]
+	tag_cache = load_tag_cache(tag_cache_path) if tag_cache_path else {}
+	songs_dir = os.path.join(config.out_dir, "songs")
+	ensure_dir(songs_dir)
+	# One listing of the songs already encoded, instead of a stat per track.
+	encoded = frozenset(os.listdir(songs_dir))
+	# The work per track is dominated by the ffmpeg subprocess, which runs
+	# outside the GIL, so threads keep every core busy without pickling.
+	with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+		# All tags are read and checked before anything is encoded.
+		tracks = list(executor.map(partial(_load_track, config, tag_cache), entries))
+		# Tracks with identical audio share one output file, so encode
+		# every md5 once only.
+		to_encode = {
+			track.md5sum: track for track in tracks
+			if output_mp4_name(track.md5sum) not in encoded
+		}
+		list(executor.map(partial(_encode_track, config), to_encode.values()))
+	if tag_cache_path:
+		# Only keep entries for files that still exist.
+		save_tag_cache(tag_cache_path, {e.path: tag_cache[e.path] for e in entries})
 	tracks.sort()
 	return tracks
 
-def metaflac_get_tags(fname: str) -> Tuple[str, Dict[str, str]]:
+
+def load_tag_cache(path: str) -> dict:
+	"""
+	Load a tag cache written by save_tag_cache. A missing or unreadable file
+	gives an empty cache.
+	"""
+	try:
+		with open(path, "rb") as f:
+			return orjson.loads(f.read())
+	except (OSError, orjson.JSONDecodeError):
+		return {}
+
+
+def save_tag_cache(path: str, tag_cache: dict) -> None:
+	"""
+	Write the tag cache to path. The file is replaced atomically so an
+	interrupted run cannot leave a truncated cache behind.
+	"""
+	tmp_path = f"{path}.{os.getpid()}.tmp"
+	Path(tmp_path).write_bytes(orjson.dumps(tag_cache))
+	os.replace(tmp_path, path)
+
+
+def cached_flac_get_tags(
+	fname: str, tag_cache: dict, st: Optional[os.stat_result] = None
+) -> Tuple[str, Dict[str, str]]:
+	"""
+	Like flac_get_tags, but reuse the result stored in tag_cache when the
+	file's size and modification time have not changed since. `st` may be
+	passed in when the caller already has the file's stat result.
+	"""
+	if st is None:
+		st = os.stat(fname)
+	entry = tag_cache.get(fname)
+	if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+		return entry[2], entry[3]
+	md5sum, tags = flac_get_tags(fname)
+	tag_cache[fname] = [st.st_mtime_ns, st.st_size, md5sum, tags]
+	return md5sum, tags
+
+def flac_get_tags(fname: str) -> Tuple[str, Dict[str, str]]:
 	"""
 	Return the metadata tags (Vorbis comments) from the file. If a tag is
 	repeated, only the last value is kept. Returns the audio data md5sum as
-	well.
-	"""
-	out = subprocess.check_output(
-		["metaflac", "--show-md5sum", "--export-tags-to=-", fname],
-		encoding="utf-8",
-	)
-	lines = out.splitlines()
-	md5sum = lines[0]
+	well. Only the metadata blocks at the start of the file are read.
+	"""
+	flac = FLAC(fname)
+	md5sum = f"{flac.info.md5_signature:032x}"
 	if md5sum == "00000000000000000000000000000000":
 		print(f"{fname} has no embedded md5sum, calculating from audio data...")
+		# Hash the samples in blocks rather than decoding the whole file into
+		# memory first; the digest is the same.
+		# Only a content id, not a security measure.
+		m = hashlib.md5(usedforsecurity=False)
 		with sf.SoundFile(fname) as f:
-			pcm = f.read(dtype='int16')
-			md5sum = hashlib.md5(pcm.tobytes()).hexdigest()
-	tags = [line.split("=", maxsplit=1) for line in lines[1:]]
-	tags = [t for t in tags if len(t) == 2]
-	return md5sum, {k.upper(): v for k, v in tags}
+			while True:
+				buf = f.buffer_read(65536, dtype='int16')
+				if not buf:
+					break
+				m.update(buf)
+		md5sum = m.hexdigest()
+	return md5sum, {k.upper(): v for k, v in flac.tags or []}
 
 
 def encode_flac_to_aac_mp4(input_path: str, out_dir: str, out_name: str) -> str:
@@ -51,22 +141,33 @@ def encode_flac_to_aac_mp4(input_path: str, out_dir: str, out_name: str) -> str:
 	no work is performed.
 	"""
 	songs_dir = os.path.join(out_dir, "songs")
-	os.makedirs(songs_dir, exist_ok=True)
+	ensure_dir(songs_dir)
 	out_path = os.path.join(songs_dir, out_name)
 	if os.path.isfile(out_path):
 		return out_path
-	# Use ffmpeg to convert to mono AAC 128k inside MP4 container, stripping metadata
-	subprocess.check_call([
-        "ffmpeg", "-i", input_path, 
-        "-map", "0:a",
-		"-map_metadata", "-1",
-        "-movflags", "faststart",
-        "-c:a", "aac",
-		"-b:a", "128k",
-        "-profile:a", "aac_low",    
-        "-ac", "1", "-ar", "44100",
-        out_path
-    ])
+	# Encode under a temporary name and move it into place once ffmpeg has
+	# finished, so an interrupted run never leaves a truncated file behind
+	# that the check above would take for a finished encode.
+	# Unique per thread as well, as encodes run on several threads at once.
+	tmp_path = os.path.join(songs_dir, f".{out_name}.{os.getpid()}.{threading.get_ident()}.tmp")
+	try:
+		# Use ffmpeg to convert to mono AAC 128k inside MP4 container, stripping metadata
+		subprocess.check_call([
+			# Several encodes run at once; none of them may read the terminal.
+			"ffmpeg", "-nostdin", "-y", "-i", input_path,
+			"-map", "0:a",
+			"-map_metadata", "-1",
+			"-movflags", "faststart",
+			"-c:a", "aac",
+			"-b:a", "128k",
+			"-profile:a", "aac_low",
+			"-ac", "1", "-ar", "44100",
+			"-f", "mp4", tmp_path
+		])
+		os.replace(tmp_path, out_path)
+	finally:
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
 
 	return out_path
 